@@ -9,29 +9,34 @@ import streamlit as st
 import sqlite3
 import csv
 import io
+import re
+import time
+import threading
+import importlib.util
 APP_ACTIVE = True  
 
 if not APP_ACTIVE:
     st.warning("🚧 Die App ist aktuell deaktiviert.")
     st.stop()
 
-try:
-    from reportlab.lib.pagesizes import A4  # type: ignore
-    from reportlab.pdfgen import canvas  # type: ignore
-except Exception:
-    A4 = None
-    canvas = None
+# reportlab is optional and heavy to import; only check that it exists here,
+# build_wrong_pdf imports it on first use.
+HAS_REPORTLAB = importlib.util.find_spec("reportlab") is not None
 
 try:
     from supabase import create_client  # type: ignore
 except Exception:
     create_client = None
 
+try:
+    import orjson  # type: ignore
+except Exception:
+    orjson = None
+
 BASE_DIR = Path(__file__).parent
 QUESTIONS_FILE = BASE_DIR / "questions.json"
 CUSTOM_FILE = BASE_DIR / "custom_questions.json"
 PROGRESS_DIR = BASE_DIR / "progress"
-PROGRESS_DIR.mkdir(exist_ok=True)
 
 
 # --- Multiple quiz datasets (select at start) ---
@@ -55,19 +60,36 @@ def get_selected_quiz_label() -> str:
         return label
     return next(iter(QUIZZES))
 
-def get_questions_file() -> Path:
-    label = get_selected_quiz_label()
-    fname = QUIZZES.get(label)
-    path = BASE_DIR / fname
+@st.cache_resource(show_spinner=False)
+def quiz_paths(label: str) -> tuple[Path, Path]:
+    """(questions file, custom file) for a quiz label, resolved once per process.
+
+    The dataset files ship with the app, so the existence check doesn't need repeating.
+    """
+    path = BASE_DIR / QUIZZES.get(label)
     # Backwards compatibility: if the chosen file doesn't exist, fall back to questions.json
     if not path.exists():
         path = DEFAULT_QUESTIONS_FILE
-    return path
+    # One custom file per quiz dataset to avoid mixing user-added questions.
+    # JSON Lines (one question per line) so adding a question is a single append.
+    return path, BASE_DIR / f"custom_{path.stem}.jsonl"
+
+def get_questions_file() -> Path:
+    return quiz_paths(get_selected_quiz_label())[0]
 
 def get_custom_file() -> Path:
-    # One custom file per quiz dataset to avoid mixing user-added questions
-    base = get_questions_file().stem
-    return BASE_DIR / f"custom_{base}.json"
+    return quiz_paths(get_selected_quiz_label())[1]
+
+def migrate_custom_file(path: Path):
+    """One-time conversion of the old custom_<quiz>.json array file to JSON Lines."""
+    legacy = path.with_suffix(".json")
+    if path.exists() or not legacy.exists():
+        return
+    append_jsonl(path, *load_questions_list(legacy))
+
+def now_iso() -> str:
+    """Current local time as ISO string (seconds), the format used for all timestamps."""
+    return datetime.now().isoformat(timespec="seconds")
 
 """Leaderboards
 
@@ -77,12 +99,67 @@ between friends, configure Supabase credentials in Streamlit secrets.
 Fallback: local SQLite leaderboard (works only for users on the same machine).
 """
 
+# Optional (recommended) Supabase function so score deltas are added atomically in one
+# request instead of select + update. It also returns the day's Top N, so the
+# leaderboard doesn't need a second request right after answering:
+#
+#     create or replace function increment_daily_score(
+#       p_player text, p_day text, p_correct int, p_wrong int, p_skipped int, p_limit int default 20,
+#       p_updated_at quiz_scores_daily.updated_at%type default now()
+#     ) returns setof quiz_scores_daily language sql as $$
+#       insert into quiz_scores_daily(player, day, correct, wrong, skipped, updated_at)
+#       values (p_player, p_day, p_correct, p_wrong, p_skipped, p_updated_at)
+#       on conflict (player, day) do update set
+#         correct = quiz_scores_daily.correct + excluded.correct,
+#         wrong = quiz_scores_daily.wrong + excluded.wrong,
+#         skipped = quiz_scores_daily.skipped + excluded.skipped,
+#         updated_at = excluded.updated_at;
+#       select * from quiz_scores_daily where day = p_day
+#       order by correct desc, wrong asc, skipped asc, lower(player), player
+#       limit p_limit;
+#     $$;
+#
+# (Older versions of this function returned void or had no p_updated_at; drop them
+# first, since Postgres can't change a function's return type in place and would keep
+# the old signature as a separate overload. Until then the app uses the fallback below.)
+#
+# Without it the app falls back to select + update/insert.
+#
+# Optional view so the "total" leaderboard is aggregated by Postgres and only the
+# Top N rows are transferred:
+#
+#     create or replace view quiz_scores_total as
+#       select player, sum(correct) as correct, sum(wrong) as wrong,
+#              sum(skipped) as skipped, max(updated_at) as updated_at
+#       from quiz_scores_daily
+#       group by player;
+#
+# Without it all rows are fetched and summed in Python.
+#
+# Recommended index for the "today" ranking (sorted and limited by Postgres):
+#
+#     create index if not exists quiz_scores_daily_day_ranking
+#       on quiz_scores_daily(day, correct desc, wrong asc, skipped asc, lower(player), player);
+#
+# Ties are ranked by lower(player), then player, everywhere (see _lb_rank_key).
+
 LEADERBOARD_DB = BASE_DIR / "leaderboard.db"  # local fallback
 
 LB_TABLE = "quiz_scores_daily"  # Supabase table name
-
+LB_INCREMENT_RPC = "increment_daily_score"  # optional Supabase function (see above)
+# PostgREST "function not found" / Postgres undefined_function: the only RPC errors
+# that mean "not installed". Anything else may have been applied already.
+LB_RPC_MISSING_CODES = ("PGRST202", "42883")
+LB_TOTAL_VIEW = "quiz_scores_total"  # optional Supabase view (see above)
+LB_WRITE_LOCK = threading.Lock()  # serializes writes on the shared local connection
+
+@st.cache_resource(show_spinner=False)
 def supabase_client():
-    """Create a Supabase client if secrets are configured, else return None."""
+    """Create a Supabase client if secrets are configured, else return None.
+
+    Cached per process: every leaderboard call (and every rerun) reuses the same
+    client and its HTTP connection pool. A missing configuration (None) is cached too.
+    """
     if create_client is None:
         return None
     try:
@@ -92,12 +169,40 @@ def supabase_client():
         return None
     if not url or not key:
         return None
-    return create_client(url, key)
+    try:
+        return create_client(url, key)
+    except Exception:
+        # e.g. a malformed URL/key: fall back to the local leaderboard. Returning (not
+        # raising) lets cache_resource remember it instead of retrying on every call.
+        return None
+
+# One statement text for every local score update, so sqlite3's per-connection
+# statement cache parses it once per process (the connection below is shared).
+LB_UPSERT_SQL = """
+    INSERT INTO scores_daily(player, day, correct, wrong, skipped, updated_at) VALUES (?,?,?,?,?,?)
+    ON CONFLICT(player, day) DO UPDATE SET
+      correct = correct + excluded.correct,
+      wrong = wrong + excluded.wrong,
+      skipped = skipped + excluded.skipped,
+      updated_at = excluded.updated_at
+"""
 
+@st.cache_resource(show_spinner=False)
 def lb_connect():
-    """Local fallback DB for leaderboard when Supabase isn't configured."""
-    conn = sqlite3.connect(str(LEADERBOARD_DB))
-    conn.execute(
+    """Local fallback DB for leaderboard when Supabase isn't configured.
+
+    One shared connection per process (schema/pragmas run once); callers must not close it.
+    Autocommit mode: every statement used here is a single atomic read or upsert;
+    writes additionally hold LB_WRITE_LOCK.
+    """
+    conn = sqlite3.connect(str(LEADERBOARD_DB), check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-16384")  # 16 MiB page cache, kept across reruns
+    # SQLite's lower() only folds ASCII; rank ties with Python's str.lower like _lb_rank_key
+    conn.create_function("py_lower", 1, str.lower, deterministic=True)
+    conn.executescript(
         """
         CREATE TABLE IF NOT EXISTS scores_daily (
           player TEXT NOT NULL,
@@ -107,17 +212,106 @@ def lb_connect():
           skipped INTEGER NOT NULL DEFAULT 0,
           updated_at TEXT NOT NULL,
           PRIMARY KEY (player, day)
-        )
+        );
+        -- "today" ranking walks this index in order and stops at LIMIT (only ties on
+        -- the scores get sorted by name); it also carries player/updated_at, so the
+        -- table itself is never touched
+        -- (per-player GROUP BY is already served by the (player, day) primary key)
+        CREATE INDEX IF NOT EXISTS idx_scores_day_ranking
+          ON scores_daily(day, correct DESC, wrong ASC, skipped ASC, player, updated_at);
         """
     )
+    conn.execute("PRAGMA optimize")  # refresh planner stats once per process
     return conn
 
-def lb_upsert_daily(player: str, day: str, delta_correct=0, delta_wrong=0, delta_skipped=0):
-    """Upsert daily score (shared via Supabase if configured; else local sqlite)."""
+LB_CACHE_TTL = 30  # seconds; leaderboards may lag behind other players by this much
+LB_TOP_N = 20
+# Leaderboard rows are shown as they come back; only the column headers are renamed.
+LB_COLUMNS = {"player": "Spieler", "correct": "✅", "wrong": "❌", "skipped": "🤷", "updated_at": "Update"}
+
+def _lb_rank_key(r: dict):
+    """Leaderboard order: most correct, fewest wrong, fewest skipped, then name (case-insensitive first)."""
+    p = str(r.get("player") or "")
+    return (-int(r.get("correct") or 0), int(r.get("wrong") or 0), int(r.get("skipped") or 0), p.lower(), p)
+
+def _lb_query_rows() -> list[dict]:
+    """All raw Supabase rows (only needed when the totals view is missing)."""
+    res = supabase_client().table(LB_TABLE).select("player,correct,wrong,skipped,updated_at").execute()
+    return getattr(res, "data", None) or []
+
+def _lb_query_today(day: str, n: int) -> list[dict]:
+    """Top N for one day; Postgres sorts and limits, so only N rows are transferred."""
+    res = (
+        supabase_client().table(LB_TABLE)
+        .select("player,correct,wrong,skipped,updated_at")
+        .eq("day", day)
+        .order("correct", desc=True).order("wrong").order("skipped").order("player")
+        .limit(int(n))
+        .execute()
+    )
+    # PostgREST can't order by lower(player); settle ties within the page like everywhere else
+    return sorted(getattr(res, "data", None) or [], key=_lb_rank_key)
+
+def _lb_query_total(n: int) -> list[dict]:
+    """Top N totals per player: from the SQL view if it exists, else aggregated here."""
+    try:
+        res = (
+            supabase_client().table(LB_TOTAL_VIEW)
+            .select("player,correct,wrong,skipped,updated_at")
+            .order("correct", desc=True).order("wrong").order("skipped").order("player")
+            .limit(int(n))
+            .execute()
+        )
+        return sorted(getattr(res, "data", None) or [], key=_lb_rank_key)
+    except Exception:
+        return _lb_aggregate_total(_lb_query_rows(), n)
+
+# Shared by all sessions for LB_CACHE_TTL and never cleared on write, so other players'
+# answers don't force refetches. Errors are raised (and thus not cached); callers handle them.
+_lb_fetch_today = st.cache_data(ttl=LB_CACHE_TTL, show_spinner=False)(_lb_query_today)
+_lb_fetch_total = st.cache_data(ttl=LB_CACHE_TTL, show_spinner=False)(_lb_query_total)
+
+def _lb_mark_own_write(day: str, today_rows=None):
+    """After this session's own score write: its next leaderboard read is fresh (see lb_get_leaderboards).
+
+    `today_rows` are the day's Top N if the write already returned them (increment RPC).
+    """
+    st.session_state["lb_snapshot"] = {
+        "day": day,
+        "today": sorted(today_rows, key=_lb_rank_key) if isinstance(today_rows, list) and today_rows else None,
+        "total": None,
+        "at": time.monotonic(),
+    }
+
+def _lb_aggregate_total(rows: list[dict], n: int) -> list[dict]:
+    """Sum daily rows per player; Top N sorted like the leaderboard (view fallback only)."""
+    agg = {}  # player -> [correct, wrong, skipped, updated_at]
+    for r in rows:
+        p = r.get("player")
+        if not p:
+            continue
+        v = agg.get(p)
+        if v is None:
+            v = agg[p] = [0, 0, 0, ""]
+        v[0] += int(r.get("correct") or 0)
+        v[1] += int(r.get("wrong") or 0)
+        v[2] += int(r.get("skipped") or 0)
+        v[3] = max(v[3], str(r.get("updated_at") or ""))
+    totals = [
+        {"player": p, "correct": v[0], "wrong": v[1], "skipped": v[2], "updated_at": v[3]}
+        for p, v in agg.items()
+    ]
+    return sorted(totals, key=_lb_rank_key)[: int(n)]
+
+def lb_upsert_daily(player: str, day: str, delta_correct=0, delta_wrong=0, delta_skipped=0, updated_at=None):
+    """Upsert daily score (shared via Supabase if configured; else local sqlite).
+
+    `updated_at` lets callers reuse the timestamp they already took for the answer.
+    """
     player = player.strip()
     if not player:
         return
-    now = datetime.now().isoformat(timespec="seconds")
+    now = updated_at or now_iso()
 
     sb = supabase_client()
     if sb is not None:
@@ -130,7 +324,26 @@ def lb_upsert_daily(player: str, day: str, delta_correct=0, delta_wrong=0, delta
             "skipped": int(delta_skipped),
             "updated_at": now,
         }
-        # We need to add deltas, not overwrite. Fetch row first.
+        # We need to add deltas, not overwrite. Preferred: one atomic RPC call.
+        try:
+            res = sb.rpc(LB_INCREMENT_RPC, {
+                "p_player": player,
+                "p_day": day,
+                "p_correct": int(delta_correct),
+                "p_wrong": int(delta_wrong),
+                "p_skipped": int(delta_skipped),
+                "p_limit": LB_TOP_N,
+                "p_updated_at": now,
+            }).execute()
+            # the submitter should see their own score right away
+            _lb_mark_own_write(day, getattr(res, "data", None))
+            return
+        except Exception as exc:
+            # Only a missing function falls through to fetch row first, then update/insert.
+            # On a timeout or lost response the RPC may have committed; retrying via the
+            # fallback would count the answer twice, so the delta is dropped instead.
+            if getattr(exc, "code", None) not in LB_RPC_MISSING_CODES:
+                return
         try:
             existing = sb.table(LB_TABLE).select("correct,wrong,skipped").eq("player", player).eq("day", day).execute()
             rows = getattr(existing, "data", None) or []
@@ -141,181 +354,116 @@ def lb_upsert_daily(player: str, day: str, delta_correct=0, delta_wrong=0, delta
                 sb.table(LB_TABLE).update({"correct": c, "wrong": w, "skipped": s, "updated_at": now}).eq("player", player).eq("day", day).execute()
             else:
                 sb.table(LB_TABLE).insert(payload).execute()
+            _lb_mark_own_write(day)
         except Exception:
             # If anything goes wrong, fail silently (quiz should still work)
             return
         return
 
     # Local fallback
-    conn = lb_connect()
-    cur = conn.cursor()
-    cur.execute("SELECT correct, wrong, skipped FROM scores_daily WHERE player=? AND day=?", (player, day))
-    row = cur.fetchone()
-    if row:
-        c, w, s = row
-        c += int(delta_correct)
-        w += int(delta_wrong)
-        s += int(delta_skipped)
-        cur.execute(
-            "UPDATE scores_daily SET correct=?, wrong=?, skipped=?, updated_at=? WHERE player=? AND day=?",
-            (c, w, s, now, player, day),
-        )
-    else:
-        cur.execute(
-            "INSERT INTO scores_daily(player, day, correct, wrong, skipped, updated_at) VALUES (?,?,?,?,?,?)",
+    with LB_WRITE_LOCK:
+        lb_connect().execute(
+            LB_UPSERT_SQL,
             (player, day, int(delta_correct), int(delta_wrong), int(delta_skipped), now),
         )
-    conn.commit()
-    conn.close()
-
+    _lb_mark_own_write(day)
 
-def lb_get_leaderboards(day: str, n: int = 20):
-    """Return (today_rows, total_rows).
-
-    Each row: {player, correct, wrong, skipped, updated_at}
-    """
-    sb = supabase_client()
-    if sb is not None:
-        try:
-            # Today
-            today_resp = sb.table(LB_TABLE).select("player,correct,wrong,skipped,updated_at").eq("day", day).execute()
-            today = getattr(today_resp, "data", None) or []
-            today.sort(key=lambda r: (-int(r.get("correct", 0)), int(r.get("wrong", 0)), int(r.get("skipped", 0))))
-            today = today[: int(n)]
-
-            # Total: fetch all and aggregate per player (simple & fine for small groups)
-            all_resp = sb.table(LB_TABLE).select("player,correct,wrong,skipped").execute()
-            rows = getattr(all_resp, "data", None) or []
-            agg = {}
-            for r in rows:
-                p = r.get("player")
-                if not p:
-                    continue
-                a = agg.setdefault(p, {"player": p, "correct": 0, "wrong": 0, "skipped": 0, "updated_at": ""})
-                a["correct"] += int(r.get("correct", 0))
-                a["wrong"] += int(r.get("wrong", 0))
-                a["skipped"] += int(r.get("skipped", 0))
-            total = list(agg.values())
-            total.sort(key=lambda r: (-r["correct"], r["wrong"], r["skipped"]))
-            total = total[: int(n)]
-            return today, total
-        except Exception:
-            return [], []
 
-    # Local fallback
-    conn = lb_connect()
-    cur = conn.cursor()
-
-    cur.execute(
+def _lb_local_query_today(day: str, n: int) -> list[dict]:
+    """Local fallback: Top N for one day."""
+    rows = lb_connect().execute(
         """
         SELECT player, correct, wrong, skipped, updated_at
         FROM scores_daily
         WHERE day=?
-        ORDER BY correct DESC, wrong ASC, skipped ASC
+        ORDER BY correct DESC, wrong ASC, skipped ASC, py_lower(player), player
         LIMIT ?
         """,
         (day, int(n)),
-    )
-    today = [
+    ).fetchall()
+    return [
         {"player": r[0], "correct": r[1], "wrong": r[2], "skipped": r[3], "updated_at": r[4]}
-        for r in cur.fetchall()
+        for r in rows
     ]
 
-    cur.execute(
+def _lb_local_query_total(n: int) -> list[dict]:
+    """Local fallback: Top N summed over all days."""
+    rows = lb_connect().execute(
         """
         SELECT player,
                SUM(correct) AS correct,
-               SUM(wrong) AS wrong,
-               SUM(skipped) AS skipped
+               SUM(wrong)   AS wrong,
+               SUM(skipped) AS skipped,
+               MAX(updated_at) AS updated_at
         FROM scores_daily
         GROUP BY player
-        ORDER BY correct DESC, wrong ASC, skipped ASC
+        ORDER BY correct DESC, wrong ASC, skipped ASC, py_lower(player), player
         LIMIT ?
         """,
         (int(n),),
-    )
-    total = [
-        {"player": r[0], "correct": r[1], "wrong": r[2], "skipped": r[3], "updated_at": ""}
-        for r in cur.fetchall()
+    ).fetchall()
+    return [
+        {"player": r[0], "correct": r[1], "wrong": r[2], "skipped": r[3], "updated_at": r[4]}
+        for r in rows
     ]
-    conn.close()
-    return today, total
 
-def lb_top_total(n=20):
+# Cached like the Supabase reads (shared, not cleared on write)
+_lb_local_today = st.cache_data(ttl=LB_CACHE_TTL, show_spinner=False)(_lb_local_query_today)
+_lb_local_total = st.cache_data(ttl=LB_CACHE_TTL, show_spinner=False)(_lb_local_query_total)
+
+def lb_get_leaderboards(day: str, n: int = LB_TOP_N):
+    """Return (today_rows, total_rows).
+
+    Each row: {player, correct, wrong, skipped, updated_at}
+
+    Normally served from the shared TTL cache. Right after this session's own write the
+    boards are read fresh once and kept in session_state for LB_CACHE_TTL, so the
+    submitter sees their new score while everyone else's cache stays valid.
+    """
+    n = int(n)
+    sb = supabase_client()
+    if sb is not None:
+        query_today, query_total, cached_today, cached_total = (
+            _lb_query_today, _lb_query_total, _lb_fetch_today, _lb_fetch_total
+        )
+    else:
+        query_today, query_total, cached_today, cached_total = (
+            _lb_local_query_today, _lb_local_query_total, _lb_local_today, _lb_local_total
+        )
+
+    snap = st.session_state.get("lb_snapshot")
+    try:
+        if not snap or snap["day"] != day or time.monotonic() - snap["at"] > LB_CACHE_TTL:
+            return cached_today(day, n), cached_total(n)
+        if snap["today"] is None:
+            snap["today"] = query_today(day, n)
+        if snap["total"] is None:
+            snap["total"] = query_total(n)
+        return snap["today"][:n], snap["total"][:n]
+    except Exception:
+        if sb is None:
+            raise
+        return [], []
+
+def lb_top_total(n=LB_TOP_N):
     """Return Top N by total correct (sum over all days)."""
     sb = supabase_client()
     if sb is not None:
         try:
-            res = sb.table(LB_TABLE).select("player,correct,wrong,skipped").execute()
-            rows = getattr(res, "data", None) or []
-            agg = {}
-            for r in rows:
-                p = r.get("player")
-                if not p:
-                    continue
-                a = agg.setdefault(p, {"player": p, "correct": 0, "wrong": 0, "skipped": 0})
-                a["correct"] += int(r.get("correct", 0))
-                a["wrong"] += int(r.get("wrong", 0))
-                a["skipped"] += int(r.get("skipped", 0))
-            out = list(agg.values())
-            out.sort(key=lambda x: (-x["correct"], x["wrong"], x["skipped"], x["player"].lower()))
-            return out[: int(n)]
+            return _lb_fetch_total(int(n))
         except Exception:
             return []
+    return _lb_local_total(int(n))
 
-    conn = lb_connect()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT player,
-               SUM(correct) AS correct,
-               SUM(wrong)   AS wrong,
-               SUM(skipped) AS skipped,
-               MAX(updated_at) AS updated_at
-        FROM scores_daily
-        GROUP BY player
-        ORDER BY correct DESC, wrong ASC, skipped ASC
-        LIMIT ?
-        """,
-        (int(n),),
-    )
-    rows = cur.fetchall()
-    conn.close()
-    return [
-        {"player": r[0], "correct": r[1], "wrong": r[2], "skipped": r[3], "updated_at": r[4]}
-        for r in rows
-    ]
-
-def lb_top_today(day: str, n=20):
+def lb_top_today(day: str, n=LB_TOP_N):
     """Return Top N for a specific day."""
     sb = supabase_client()
     if sb is not None:
         try:
-            res = sb.table(LB_TABLE).select("player,correct,wrong,skipped,updated_at").eq("day", day).execute()
-            rows = getattr(res, "data", None) or []
-            rows.sort(key=lambda r: (-int(r.get("correct", 0)), int(r.get("wrong", 0)), int(r.get("skipped", 0)), (r.get("player") or "").lower()))
-            return rows[: int(n)]
+            return _lb_fetch_today(day, int(n))
         except Exception:
             return []
-
-    conn = lb_connect()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT player, correct, wrong, skipped, updated_at
-        FROM scores_daily
-        WHERE day=?
-        ORDER BY correct DESC, wrong ASC, skipped ASC
-        LIMIT ?
-        """,
-        (day, int(n)),
-    )
-    rows = cur.fetchall()
-    conn.close()
-    return [
-        {"player": r[0], "correct": r[1], "wrong": r[2], "skipped": r[3], "updated_at": r[4]}
-        for r in rows
-    ]
+    return _lb_local_today(day, int(n))
 
 def safe_explanation(q: dict) -> str:
     """Return a user-friendly explanation. If none exists, provide a placeholder."""
@@ -338,13 +486,56 @@ def safe_explanation(q: dict) -> str:
         return "Noch keine ausführliche Erklärung hinterlegt. Lösungsvorschlag: " + sol
     return "Noch keine Erklärung hinterlegt. (Du kannst unten im Bereich „Neue Frage hinzufügen“ eine Erklärung ergänzen.)"
 
+def json_dumps(obj) -> str:
+    """Compact JSON text (used for the SQLite progress columns)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+def json_loads(text):
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
 def load_json(path, default):
     if path.exists():
+        if orjson is not None:
+            return orjson.loads(path.read_bytes())
         return json.loads(path.read_text(encoding="utf-8"))
     return default
 
-def save_json(path, obj):
-    path.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
+def append_jsonl(path, *objs):
+    """Append records as lines (no need to read or rewrite the existing file).
+
+    All records go out in a single write, so batches cost one open/write like a single record.
+    If the file ends in a partial line (interrupted append), a newline is written first so
+    the partial line does not swallow the first new record.
+    """
+    if orjson is not None:
+        data = b"".join(orjson.dumps(o) + b"\n" for o in objs)
+    else:
+        data = "".join(json.dumps(o, ensure_ascii=False) + "\n" for o in objs).encode("utf-8")
+    with open(path, "a+b") as f:
+        if f.seek(0, os.SEEK_END) > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                data = b"\n" + data
+        f.write(data)
+
+def load_jsonl(path: Path) -> list[dict]:
+    """Read a JSON Lines file; blank or unreadable lines (e.g. an interrupted append) are skipped."""
+    if not path.exists():
+        return []
+    out = []
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                obj = json_loads(line)
+            except ValueError:
+                continue
+            if isinstance(obj, dict):
+                out.append(obj)
+    return out
 
 def load_questions_list(path: Path) -> list[dict]:
     """Load a questions JSON file and always return a LIST of question dicts.
@@ -374,8 +565,9 @@ def normalize_ids(qs: list[dict]) -> list[dict]:
     """Ensure every question has a unique int 'id'."""
     out = []
     used = set()
+    missing = []
     next_id = 1
-    # first pass: keep valid ids
+    # first pass: keep valid ids (all of them must be reserved before filling gaps)
     for q in qs:
         q2 = dict(q)
         qid = q2.get("id", None)
@@ -388,17 +580,20 @@ def normalize_ids(qs: list[dict]) -> list[dict]:
             used.add(qid_int)
         else:
             q2["id"] = None
+            missing.append(q2)
         out.append(q2)
-    # second pass: fill missing ids
-    for q2 in out:
-        if q2["id"] is None:
-            while next_id in used:
-                next_id += 1
-            q2["id"] = next_id
-            used.add(next_id)
+    # second pass: fill missing ids (next_id only moves forward, so this is O(n) overall)
+    for q2 in missing:
+        while next_id in used:
             next_id += 1
+        q2["id"] = next_id
+        used.add(next_id)
+        next_id += 1
     return out
 
+# Alternative schema keys for the answer options, in priority order
+OPTION_KEYS = ('options', 'choices', 'answers', 'antworten', 'optionen')
+
 def canonicalize_question(q: dict) -> dict:
     """Make question dict robust across different JSON schemas."""
     q2 = dict(q) if isinstance(q, dict) else {}
@@ -406,14 +601,8 @@ def canonicalize_question(q: dict) -> dict:
     text = (q2.get('question') or q2.get('frage') or q2.get('text') or q2.get('prompt') or q2.get('title') or '').strip()
     q2['question'] = text if text else '(Fragetext fehlt – bitte JSON prüfen)'
 
-    # options / choices
-    opts = q2.get('options')
-    if not isinstance(opts, list):
-        for k in ('choices','answers','antworten','optionen'):
-            v = q2.get(k)
-            if isinstance(v, list):
-                opts = v
-                break
+    # options / choices: first list-valued key wins
+    opts = next((v for k in OPTION_KEYS if isinstance(v := q2.get(k), list)), None)
 
     choice_ids = []
     option_texts = []
@@ -506,6 +695,7 @@ def canonicalize_question(q: dict) -> dict:
     else:
         corr = []
     q2['correct'] = corr
+    q2['_correct_set'] = frozenset(corr)  # used by is_correct_mc
 
     # explanation/solution fields
     if 'explanation' not in q2 or q2.get('explanation') is None:
@@ -528,13 +718,25 @@ def canonicalize_question(q: dict) -> dict:
 def canonicalize_questions(qs: list[dict]) -> list[dict]:
     return [canonicalize_question(q) for q in (qs or []) if isinstance(q, dict)]
 
-def load_questions():
-    # Load from the selected dataset (one JSON per quiz)
-    q_file = get_questions_file()
-    c_file = get_custom_file()
+def file_mtime_ns(path: Path) -> int:
+    """Modification time of a file in ns (0 if it doesn't exist). Used as cache key."""
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return 0
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _load_questions_cached(q_path: str, q_mtime: int, c_path: str, c_mtime: int):
+    """Parse + canonicalize a quiz dataset once; the mtimes only serve as cache keys.
 
-    base = load_questions_list(q_file)
-    custom = load_questions_list(c_file)
+    cache_resource hands back the same objects on every rerun (cache_data would unpickle
+    a fresh copy each time), so the result is shared and must be treated as read-only.
+
+    Returns (questions, by_id, ids, ids_set, ids_fp). IDs are ints after normalization, so
+    callers never need to cast them again; ids_fp fingerprints the id set (see ensure_daily_order).
+    """
+    base = load_questions_list(Path(q_path))
+    custom = load_jsonl(Path(c_path))
     # Canonicalize schema so downstream code can rely on keys like 'question', 'type', 'options', 'correct'.
     base = canonicalize_questions(base)
     custom = canonicalize_questions(custom)
@@ -545,9 +747,9 @@ def load_questions():
 
     # Custom questions get ids after base max (stable per quiz)
     if custom:
-        base_max = max(int(q["id"]) for q in base) if base else 0
+        base_max = max(q["id"] for q in base) if base else 0
         custom_norm = []
-        used = set(int(q["id"]) for q in base) if base else set()
+        used = set(q["id"] for q in base)
         next_id = base_max + 1
         for q in custom:
             q2 = dict(q)
@@ -567,7 +769,20 @@ def load_questions():
             custom_norm.append(q2)
         custom = custom_norm
 
-    return base + custom
+    questions = base + custom
+    ids = tuple(q["id"] for q in questions)
+    by_id = dict(zip(ids, questions))
+    return questions, by_id, ids, frozenset(ids), hash(ids)
+
+def load_questions():
+    """Return (questions, by_id, ids, ids_set, ids_fp) for the selected quiz.
+
+    Cached by file mtime: re-parsed only when the dataset or its custom file changes.
+    """
+    q_file = get_questions_file()
+    c_file = get_custom_file()
+    migrate_custom_file(c_file)
+    return _load_questions_cached(str(q_file), file_mtime_ns(q_file), str(c_file), file_mtime_ns(c_file))
 
 def player_file(player: str) -> Path:
     safe = "".join(ch for ch in player.strip() if ch.isalnum() or ch in ("-","_")).strip()
@@ -578,41 +793,247 @@ def player_file(player: str) -> Path:
     quiz_slug = get_questions_file().stem
     return PROGRESS_DIR / f"{safe.lower()}__{quiz_slug}.json"
 
-def load_player_state(player: str):
-    path = player_file(player)
-    return load_json(path, {
+# Player progress
+#
+# Stored in one SQLite file (progress/progress.db) instead of rewriting a whole JSON
+# file per click: the small meta row is rewritten on every save, answer records and
+# daily counters only for what actually changed. Legacy per-player JSON files are
+# imported on first load.
+
+PROGRESS_DB = PROGRESS_DIR / "progress.db"
+
+# Answer maps of the practice runs (focus mode / "Nur die Falschen üben"); stored per
+# record in player_run_answers like `answered`, so nav clicks don't re-serialize them.
+RUN_ANSWER_KEYS = ("focus_answered", "practice_answered")
+# state keys with their own column/table; everything else goes into extra_json
+STATE_COLUMN_KEYS = ("cursor", "order_date", "order", "shuffle_nonce", "version", "answered", "daily", *RUN_ANSWER_KEYS)
+DAILY_KEYS = ("correct", "wrong", "skipped", "unsure", "total")
+
+@st.cache_resource(show_spinner=False)
+def progress_db():
+    """Shared (connection, lock) for the progress DB, created once per process.
+
+    Sessions run on different threads; hold the lock for every read/transaction.
+    """
+    PROGRESS_DIR.mkdir(exist_ok=True)
+    conn = sqlite3.connect(str(PROGRESS_DB), check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS player_meta (
+          player_key TEXT PRIMARY KEY,
+          cursor INTEGER NOT NULL DEFAULT 0,
+          order_date TEXT NOT NULL DEFAULT '',
+          order_json TEXT NOT NULL DEFAULT '[]',
+          shuffle_nonce INTEGER NOT NULL DEFAULT 0,
+          extra_json TEXT NOT NULL DEFAULT '{}',
+          version INTEGER NOT NULL DEFAULT 0  -- bumped by every save (see player_version)
+        );
+        CREATE TABLE IF NOT EXISTS player_answers (
+          player_key TEXT NOT NULL,
+          qid INTEGER NOT NULL,
+          record_json TEXT NOT NULL,
+          PRIMARY KEY (player_key, qid)
+        );
+        CREATE TABLE IF NOT EXISTS player_run_answers (
+          player_key TEXT NOT NULL,
+          run TEXT NOT NULL,  -- state key, see RUN_ANSWER_KEYS
+          qid INTEGER NOT NULL,
+          record_json TEXT NOT NULL,
+          PRIMARY KEY (player_key, run, qid)
+        );
+        CREATE TABLE IF NOT EXISTS player_daily (
+          player_key TEXT NOT NULL,
+          day TEXT NOT NULL,
+          correct INTEGER NOT NULL DEFAULT 0,
+          wrong INTEGER NOT NULL DEFAULT 0,
+          skipped INTEGER NOT NULL DEFAULT 0,
+          unsure INTEGER NOT NULL DEFAULT 0,
+          total INTEGER NOT NULL DEFAULT 0,
+          PRIMARY KEY (player_key, day)
+        );
+        """
+    )
+    # DBs created before the version column existed
+    if "version" not in {r[1] for r in conn.execute("PRAGMA table_info(player_meta)")}:
+        conn.execute("ALTER TABLE player_meta ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+    return conn, threading.Lock()
+
+def player_key(player: str) -> str:
+    """Storage key per player + quiz dataset (same name as the legacy JSON file)."""
+    return player_file(player).stem
+
+def default_player_state(player: str) -> dict:
+    return {
         "player": player,
         "cursor": 0,        # position within today's shuffled order
         "order_date": "",   # YYYY-MM-DD
         "order": [],        # list of question IDs in the order shown today
         "answered": {},      # qid -> {"ts": iso, "correct": bool, "selected": ...}
         "daily": {},         # "YYYY-MM-DD" -> {"correct": int, "wrong": int, "skipped": int, "total": int}
-    })
+    }
+
+def player_version(player: str) -> int:
+    """Stored version of the player's state (0 if none yet); one primary-key lookup.
+
+    Every save bumps it, so a session can tell when another tab/device has saved since
+    it loaded its copy.
+    """
+    conn, lock = progress_db()
+    with lock:
+        row = conn.execute("SELECT version FROM player_meta WHERE player_key=?", (player_key(player),)).fetchone()
+    return int(row[0]) if row else 0
+
+def load_player_state(player: str):
+    key = player_key(player)
+    conn, lock = progress_db()
+    with lock:
+        row = conn.execute(
+            "SELECT cursor, order_date, order_json, shuffle_nonce, extra_json, version FROM player_meta WHERE player_key=?",
+            (key,),
+        ).fetchone()
+        if row is not None:
+            state = json_loads(row[4] or "{}")
+            state["cursor"] = int(row[0])
+            state["order_date"] = row[1]
+            state["order"] = json_loads(row[2] or "[]")
+            state["shuffle_nonce"] = int(row[3])
+            state["version"] = int(row[5])
+            state["answered"] = {
+                str(qid): json_loads(rec)
+                for qid, rec in conn.execute("SELECT qid, record_json FROM player_answers WHERE player_key=?", (key,))
+            }
+            for run, qid, rec in conn.execute(
+                "SELECT run, qid, record_json FROM player_run_answers WHERE player_key=?", (key,)
+            ):
+                state.setdefault(run, {})[str(qid)] = json_loads(rec)
+            state["daily"] = {
+                r[0]: dict(zip(DAILY_KEYS, r[1:]))
+                for r in conn.execute(
+                    "SELECT day, correct, wrong, skipped, unsure, total FROM player_daily WHERE player_key=?", (key,)
+                )
+            }
+            return state
+
+    # Migration: import the old JSON file once (it stays on disk as backup)
+    legacy = player_file(player)
+    if legacy.exists():
+        state = load_json(legacy, None) or default_player_state(player)
+        save_player_state(player, state, full=True)
+        return state
+    return default_player_state(player)
+
+def save_player_state(player: str, state: dict, qids=(), full: bool = False, day: str | None = None,
+                      daily_delta: dict | None = None):
+    """Persist player state.
+
+    Always writes the meta row and bumps its version (state["version"] follows it, or is
+    reset when another session saved in between, so the next rerun reloads). Answer
+    records (master and practice-run maps) are only written for `qids` (the ones changed
+    by this action); a run map that was dropped or reset to {} has its rows deleted.
+    Daily counters are added, not overwritten: `daily_delta` (from bump_daily) goes onto
+    `day`'s row, so two sessions of one player add up. `full=True` replaces all stored
+    answers/daily rows (needed after resets and for the JSON migration).
+    """
+    key = player_key(player)
+    answered = state.get("answered") or {}
+    daily = state.get("daily") or {}
+    extra = {k: v for k, v in state.items() if k not in STATE_COLUMN_KEYS}
+
+    runs = {run: state.get(run) or {} for run in RUN_ANSWER_KEYS}
+    if full:
+        qids = list(answered.keys())
+        run_rows = [(run, q0) for run, recs in runs.items() for q0 in recs]
+        daily_rows = [(key, d0, *(int(daily[d0].get(k, 0) or 0) for k in DAILY_KEYS)) for d0 in daily]
+    else:
+        run_rows = [(run, str(q0)) for run, recs in runs.items() for q0 in qids if str(q0) in recs]
+        daily_rows = [(key, day, *(int(daily_delta.get(k, 0)) for k in DAILY_KEYS))] if daily_delta else []
+
+    conn, lock = progress_db()
+    with lock, conn:
+        conn.execute(
+            """
+            INSERT INTO player_meta(player_key, cursor, order_date, order_json, shuffle_nonce, extra_json, version)
+            VALUES (?,?,?,?,?,?,1)
+            ON CONFLICT(player_key) DO UPDATE SET
+              cursor=excluded.cursor, order_date=excluded.order_date, order_json=excluded.order_json,
+              shuffle_nonce=excluded.shuffle_nonce, extra_json=excluded.extra_json,
+              version=player_meta.version + 1
+            """,
+            (
+                key,
+                int(state.get("cursor", 0) or 0),
+                state.get("order_date") or "",
+                json_dumps(state.get("order") or []),
+                int(state.get("shuffle_nonce", 0) or 0),
+                json_dumps(extra),
+            ),
+        )
+        version = conn.execute("SELECT version FROM player_meta WHERE player_key=?", (key,)).fetchone()[0]
+        # Anything but our own +1 means another session saved since we loaded: reload next rerun.
+        state["version"] = version if version == int(state.get("version", 0) or 0) + 1 else -1
+        if full:
+            conn.execute("DELETE FROM player_answers WHERE player_key=?", (key,))
+            conn.execute("DELETE FROM player_run_answers WHERE player_key=?", (key,))
+            conn.execute("DELETE FROM player_daily WHERE player_key=?", (key,))
+        else:
+            conn.executemany(
+                "DELETE FROM player_run_answers WHERE player_key=? AND run=?",
+                [(key, run) for run, recs in runs.items() if not recs],
+            )
+        conn.executemany(
+            """
+            INSERT INTO player_answers(player_key, qid, record_json) VALUES (?,?,?)
+            ON CONFLICT(player_key, qid) DO UPDATE SET record_json=excluded.record_json
+            """,
+            [(key, int(q0), json_dumps(answered[str(q0)])) for q0 in qids if str(q0) in answered],
+        )
+        conn.executemany(
+            """
+            INSERT INTO player_run_answers(player_key, run, qid, record_json) VALUES (?,?,?,?)
+            ON CONFLICT(player_key, run, qid) DO UPDATE SET record_json=excluded.record_json
+            """,
+            [(key, run, int(q0), json_dumps(runs[run][q0])) for run, q0 in run_rows],
+        )
+        conn.executemany(
+            """
+            INSERT INTO player_daily(player_key, day, correct, wrong, skipped, unsure, total) VALUES (?,?,?,?,?,?,?)
+            ON CONFLICT(player_key, day) DO UPDATE SET
+              correct=correct+excluded.correct, wrong=wrong+excluded.wrong, skipped=skipped+excluded.skipped,
+              unsure=unsure+excluded.unsure, total=total+excluded.total
+            """,
+            daily_rows,
+        )
+
 
+def deterministic_shuffle(player: str, day: str, items) -> list[int]:
+    """Stable shuffle per player+day, so you get variety but can continue where you stopped.
 
-def deterministic_shuffle(player: str, day: str, items: list[int]) -> list[int]:
-    """Stable shuffle per player+day, so you get variety but can continue where you stopped."""
-    seed_bytes = hashlib.sha256((player + "|" + day).encode("utf-8")).digest()
-    seed = int.from_bytes(seed_bytes[:8], "big", signed=False)
+    `items` may be any sequence of ids (e.g. the cached ids tuple); it is copied once into
+    the list that gets shuffled in place. Only called when a new order is generated.
+    """
+    # Only reproducibility is needed here, not cryptographic strength -> 8-byte blake2b
+    seed_bytes = hashlib.blake2b((player + "|" + day).encode("utf-8"), digest_size=8).digest()
+    seed = int.from_bytes(seed_bytes, "big", signed=False)
     rng = random.Random(seed)
     out = list(items)
     rng.shuffle(out)
     return out
 
 
-def ensure_daily_order(state: dict, player: str, questions: list[dict]):
-    """Ensure state has a shuffled order for today.
+def ensure_daily_order(state: dict, player: str, ids: tuple[int, ...], ids_set: frozenset[int], ids_fp: int, day: str) -> bool:
+    """Ensure state has a shuffled order for today. Returns True if state was changed.
 
     IMPORTANT: state['order'] may contain duplicates (spaced repetition).
     We must NOT force len(order) == len(ids) or set(order) == ids_set.
-    """
-    today = str(date.today())
-    ids = [int(q["id"]) for q in questions]
-    ids_set = set(ids)
 
+    state['ids_fp'] remembers the question set the order was last checked against;
+    as long as it matches, the set comparisons below are skipped.
+    """
     # A nonce lets us restart "from the beginning" with a different shuffle on the same day.
     nonce = int(state.get("shuffle_nonce", 0) or 0)
-    mix_key = f"{today}#{nonce}"
+    mix_key = f"{day}#{nonce}"
 
     order = state.get("order") or []
     order_date = state.get("order_date") or ""
@@ -622,61 +1043,189 @@ def ensure_daily_order(state: dict, player: str, questions: list[dict]):
         state["order_date"] = mix_key
         state["order"] = deterministic_shuffle(player, mix_key, ids)
         state["cursor"] = 0
-        return
-
-    # Normalize stored order to ints
-    try:
-        order_ints = [int(x) for x in order]
-    except Exception:
-        order_ints = []
+        state["ids_fp"] = ids_fp
+        return True
 
-    # If order contains IDs that no longer exist -> regenerate
-    if not set(order_ints).issubset(ids_set):
-        state["order_date"] = mix_key
-        state["order"] = deterministic_shuffle(player, mix_key, ids)
-        state["cursor"] = 0
-        return
+    changed = False
+    if state.get("ids_fp") != ids_fp:
+        # Normalize stored order to ints
+        try:
+            order_ints = [int(x) for x in order]
+        except Exception:
+            order_ints = []
 
-    # If new questions were added since last time, append them (keep existing order!)
-    order_set = set(order_ints)
-    missing = [i for i in ids if i not in order_set]
-    if missing:
-        missing_shuffled = deterministic_shuffle(player, mix_key + "|new", missing)
-        order_ints = order_ints + missing_shuffled
-        state["order"] = order_ints
-    else:
+        # If order contains IDs that no longer exist -> regenerate
+        order_set = set(order_ints)
+        if not order_set <= ids_set:
+            state["order_date"] = mix_key
+            state["order"] = deterministic_shuffle(player, mix_key, ids)
+            state["cursor"] = 0
+            state["ids_fp"] = ids_fp
+            return True
+
+        # If new questions were added since last time, append them (keep existing order!)
+        # order_set is a subset here, so equal sizes means nothing is missing.
+        missing = [i for i in ids if i not in order_set] if len(order_set) < len(ids_set) else []
+        if missing:
+            missing_shuffled = deterministic_shuffle(player, mix_key + "|new", missing)
+            order_ints = order_ints + missing_shuffled
         state["order"] = order_ints
+        state["ids_fp"] = ids_fp
+        changed = True
 
     # Keep cursor in range. NOTE: order can be longer than ids because of repeats.
-    state["cursor"] = max(0, min(int(state.get("cursor", 0)), len(state["order"])))
-
-def bump_daily(state, correct=None, skipped=False, unsure=False):
-    key = str(date.today())
-    d = state["daily"].setdefault(key, {"correct": 0, "wrong": 0, "skipped": 0, "unsure": 0, "total": 0})
-    d["total"] += 1
+    cursor = max(0, min(int(state.get("cursor", 0)), len(state["order"])))
+    if cursor != state.get("cursor"):
+        state["cursor"] = cursor
+        changed = True
+    return changed
+
+def bump_daily(state, day, correct=None, skipped=False, unsure=False):
+    """Count one answer in `day`'s counters. Returns the increments (save_player_state's daily_delta)."""
+    delta = dict.fromkeys(DAILY_KEYS, 0)
+    delta["total"] = 1
     if skipped:
-        d["skipped"] += 1
+        delta["skipped"] = 1
     else:
-        if correct is True:
-            d["correct"] += 1
-        else:
-            d["wrong"] += 1
+        delta["correct" if correct is True else "wrong"] = 1
         if unsure:
-            d["unsure"] += 1
+            delta["unsure"] = 1
+    d = format_daily(state, day)
+    for k, v in delta.items():
+        d[k] += v
+    return delta
 
-def format_daily(state):
-    key = str(date.today())
-    d = state["daily"].get(key, {"correct": 0, "wrong": 0, "skipped": 0, "unsure": 0, "total": 0})
-    return d
+def format_daily(state, day):
+    """Counters of `day` (today_str). Returns the dict stored in state, so bump_daily updates the same object."""
+    return state["daily"].setdefault(day, {"correct": 0, "wrong": 0, "skipped": 0, "unsure": 0, "total": 0})
 
 
 def is_correct_mc(q, selected):
-    correct = set(q.get("correct", []))
+    correct = q.get("_correct_set")
+    if correct is None:
+        correct = frozenset(q.get("correct", []))
     if q.get("answerType", "single") == "multi":
-        return set(selected) == correct
+        return len(selected) == len(correct) and correct.issuperset(selected)
     return len(selected) == 1 and selected[0] in correct
 
+def needs_practice(a) -> bool:
+    """Wrong, skipped or unsure answer record. Open questions (correct=None) don't count as wrong."""
+    return bool(a) and (a.get("skipped") is True or a.get("correct") is False or a.get("unsure") is True)
+
+def find_unanswered(order: list, answered: dict, start: int = 0):
+    """Index of the first unanswered id at/after `start`, wrapping around; None if all are answered.
+
+    Starting at the cursor makes the common case O(1): the current question is usually
+    the unanswered one, and answered ones pile up behind it.
+    """
+    n = len(order)
+    for i in range(n):
+        j = (start + i) % n
+        if str(order[j]) not in answered:
+            return j
+    return None
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_wrong_csv(key: tuple, _wrong_questions: list[dict]) -> bytes:
+    """CSV export of the wrong questions. `key` identifies the content (see finish screen)."""
+    # Encode while writing (no separate str copy of the whole CSV); the BOM lets Excel
+    # pick up UTF-8, so umlauts survive a double-click open.
+    csv_buf = io.BytesIO()
+    text_buf = io.TextIOWrapper(csv_buf, encoding="utf-8-sig", newline="", write_through=True)
+    writer = csv.writer(text_buf)
+    writer.writerow(["id", "type", "question", "options", "correct", "explanation"])
+    writer.writerows(
+        [
+            w.get("id"),
+            w.get("type"),
+            w.get("question"),
+            " | ".join(map(str, w.get("options") or [])),
+            ",".join(map(str, w.get("correct") or [])),
+            (w.get("explanation") or w.get("solution") or ""),
+        ]
+        for w in _wrong_questions
+    )
+    text_buf.flush()
+    text_buf.detach()  # keep csv_buf open when the wrapper is collected
+    return csv_buf.getvalue()
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_wrong_pdf(key: tuple, _wrong_questions: list[dict]) -> bytes:
+    """PDF export of the wrong questions (requires reportlab). `key` ends with (player, day)."""
+    from reportlab.lib.pagesizes import A4  # type: ignore
+    from reportlab.lib.utils import simpleSplit  # type: ignore
+    from reportlab.pdfgen import canvas  # type: ignore
+
+    player, day = key[-2:]
+    pdf_buffer = io.BytesIO()
+    c = canvas.Canvas(pdf_buffer, pagesize=A4)
+    width, height = A4
+    x = 40
+    y = height - 50
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(x, y, f"Falsche/übersprungene Fragen – {player}")
+    y -= 25
+    c.setFont("Helvetica", 10)
+    c.drawString(x, y, f"Datum: {day}   Anzahl: {len(_wrong_questions)}")
+    y -= 30
+
+    def write_wrapped(text: str, y_pos: float, font="Helvetica", size=10, max_width=width - 2 * x):
+        # Wrap by measured glyph widths (points); one text object per block, so the font
+        # is set once instead of per line.
+        lines = simpleSplit(text or "", font, size, max_width)
+        if not lines:
+            return y_pos
+        t = c.beginText(x, y_pos)
+        t.setFont(font, size, leading=14)
+        t.textLines(lines, trim=0)
+        c.drawText(t)
+        return t.getY()
+
+    for idx, w in enumerate(_wrong_questions, start=1):
+        if y < 120:
+            c.showPage()
+            y = height - 50
+        c.setFont("Helvetica-Bold", 11)
+        c.drawString(x, y, f"{idx}. (ID {w.get('id')})")
+        y -= 16
+        y = write_wrapped(str(w.get("question") or ""), y, font="Helvetica", size=10)
+
+        if w.get("type") == "mc":
+            opts = w.get("options") or []
+            corr = w.get("_correct_set") or frozenset(w.get("correct") or [])
+            for oi, opt in enumerate(opts):
+                prefix = "✅" if oi in corr else "•"
+                y = write_wrapped(f"{prefix} {opt}", y, font="Helvetica", size=9)
+        else:
+            sol = (w.get("solution") or "").strip()
+            if sol:
+                y = write_wrapped(f"Lösung: {sol}", y, font="Helvetica", size=9)
+
+        exp = (w.get("explanation") or "").strip()
+        if exp:
+            y = write_wrapped(f"Erklärung: {exp}", y, font="Helvetica", size=9)
+        y -= 8
+
+    c.save()
+    return pdf_buffer.getvalue()
+
 HAS_DIALOG = hasattr(st, "dialog")
+# Fragments rerun on their own widget events only (st.fragment >= 1.37, experimental before).
+st_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda f: f)
+
+# "2" / "0,3" / "0, 3," -> comma-separated 0-based indices (empty parts are ignored)
+CORRECT_LINE_RE = re.compile(r"^\s*(\d+\s*)?(,\s*(\d+\s*)?)*$")
+
+CUSTOM_TYPE_LABELS = {"mc_single": "mc (Single Choice)", "mc_multi": "mc (Multiple Choice)", "open": "open"}
+
+# Fixed fields (and key order) of user-added questions; the form fills in the rest.
+CUSTOM_MC_TEMPLATE = {
+    "type": "mc", "question": "", "options": [], "correct": [], "answerType": "single",
+    "hint": "", "explanation": "", "confidence": "user_added",
+}
+CUSTOM_OPEN_TEMPLATE = {
+    "type": "open", "question": "", "options": [], "solution": "", "hint": "", "source": "user_added",
+}
 
 st.set_page_config(page_title="Lern-Quiz", layout="centered")
 
@@ -700,13 +1249,16 @@ if st.session_state.get("quiz_label") is None:
     st.stop()
 
 st.title("📚 Lern-Quiz (aus deinem Lernzettel)")
-st.caption("Speichert deinen Fortschritt pro Spielername lokal im Ordner „quiz_app/progress“.")
+st.caption("Speichert deinen Fortschritt pro Spielername lokal in „progress/progress.db“.")
 
-questions = load_questions()
+questions, by_id, question_ids, question_id_set, question_ids_fp = load_questions()
 if not questions:
     st.error(f"Keine Fragen gefunden. Erwartete Datei: {get_questions_file().name}. Prüfe den Dateinamen und ob die JSON-Datei Inhalt hat.")
     st.stop()
 
+# One date per rerun: labels, exports and counters agree even across midnight.
+today_str = date.today().isoformat()
+
 with st.sidebar:
     st.subheader("Quiz")
     st.write(f"Aktives Quiz: **{get_selected_quiz_label()}**")
@@ -719,31 +1271,41 @@ with st.sidebar:
     player = st.text_input("Spielername", value=st.session_state.get("player",""))
     if player:
         st.session_state["player"] = player
-        state = load_player_state(player)
-        # Ensure a deterministic shuffled order for today.
-        ensure_daily_order(state, player, questions)
-        save_json(player_file(player), state)
+        # Keep the loaded dict in the session and only re-read it when the player/quiz
+        # changes or another tab/device has saved since (version check: one PK lookup).
+        key = player_key(player)
+        cached = st.session_state.get("player_state")
+        if cached and cached[0] == key and cached[1].get("version", 0) == player_version(player):
+            state = cached[1]
+        else:
+            state = load_player_state(player)
+            st.session_state["player_state"] = (key, state)
+        # Ensure a deterministic shuffled order for today (only write if it had to change).
+        if ensure_daily_order(state, player, question_ids, question_id_set, question_ids_fp, today_str):
+            save_player_state(player, state, day=today_str)
     else:
         st.info("Gib einen Spielernamen ein, damit Fortschritt gespeichert werden kann.")
         st.stop()
 
-    d = format_daily(state)
+    daily_today = format_daily(state, today_str)
     st.markdown("### Heute")
-    st.write(f"✅ richtig: **{d['correct']}**")
-    st.write(f"❌ falsch: **{d['wrong']}**")
-    st.write(f"🟡 unsicher: **{d.get('unsure',0)}**")
-    st.write(f"🤷 nicht gewusst: **{d['skipped']}**")
-    st.write(f"🧮 gesamt: **{d['total']}**")
+    st.write(f"✅ richtig: **{daily_today['correct']}**")
+    st.write(f"❌ falsch: **{daily_today['wrong']}**")
+    st.write(f"🟡 unsicher: **{daily_today.get('unsure',0)}**")
+    st.write(f"🤷 nicht gewusst: **{daily_today['skipped']}**")
+    st.write(f"🧮 gesamt: **{daily_today['total']}**")
     st.divider()
 
     show_lb = st.toggle("🏁 Vergleich / Leaderboard", value=False)
     if show_lb:
         st.caption("Für Freunde-Vergleich: deployen + Supabase einrichten. Lokal vergleicht es nur auf diesem PC.")
-        today_rows, total_rows = lb_get_leaderboards(str(date.today()), n=20)
+        today_rows, total_rows = lb_get_leaderboards(today_str, n=LB_TOP_N)
         st.write("**Heute (Top 20)**")
         if today_rows:
             st.dataframe(
-                [{"Spieler": r["player"], "✅": r["correct"], "❌": r["wrong"], "🤷": r["skipped"], "Update": r.get("updated_at","")} for r in today_rows],
+                today_rows,
+                column_order=tuple(LB_COLUMNS),
+                column_config=LB_COLUMNS,
                 hide_index=True,
                 use_container_width=True,
             )
@@ -753,7 +1315,9 @@ with st.sidebar:
         st.write("**Gesamt (Top 20)**")
         if total_rows:
             st.dataframe(
-                [{"Spieler": r["player"], "✅": r["correct"], "❌": r["wrong"], "🤷": r["skipped"], "Update": r.get("updated_at","")} for r in total_rows],
+                total_rows,
+                column_order=tuple(LB_COLUMNS),
+                column_config=LB_COLUMNS,
                 hide_index=True,
                 use_container_width=True,
             )
@@ -763,16 +1327,20 @@ with st.sidebar:
     st.divider()
     if st.button("Fortschritt zurücksetzen (nur Cursor)"):
         state["cursor"] = 0
-        save_json(player_file(player), state)
+        save_player_state(player, state, day=today_str)
         st.success("Cursor zurückgesetzt. (Antwort-Historie bleibt erhalten.)")
     if st.button("Alles zurücksetzen (Cursor + Historie)"):
-        state = {
-            "player": player, "cursor": 0, "order_date": "", "order": [], "answered": {}, "daily": {}
-        }
-        save_json(player_file(player), state)
+        version = state.get("version", 0)
+        state.clear()  # in place: the session keeps a reference to this dict
+        state.update({
+            "player": player, "cursor": 0, "order_date": "", "order": [], "answered": {}, "daily": {},
+            "version": version,
+        })
+        save_player_state(player, state, full=True)
+        daily_today = format_daily(state, today_str)
         st.success("Alles zurückgesetzt.")
 
-order = state.get("order") or [int(q["id"]) for q in questions]
+order = state.get("order") or list(question_ids)
 cursor_pos = int(state.get("cursor", 0))
 # cursor may be == len(order) to indicate "finished"
 cursor_pos = max(0, min(cursor_pos, len(order)))
@@ -781,38 +1349,62 @@ cursor_pos = max(0, min(cursor_pos, len(order)))
 if "mode" not in state:
     state["mode"] = "normal"  # normal | focus_wrong
 
-def compute_focus_list():
-    """IDs to practice again (wrong OR skipped OR unsure) excluding those already mastered."""
-    out = []
+def save_state(*drop, full=False, force=False, **updates):
+    """Drop keys / apply updates on the player state and persist it.
+
+    The write is skipped when the drops/updates would not change anything (e.g. a click
+    that lands on the current position), so changes made to `state` directly before the
+    call must be passed in as well, or flagged with `force=True`. Also used as an on_click
+    callback: it then runs before the next script run, so the button needs no st.rerun().
+    """
+    changed = full or force or any(k in state for k in drop) or any(
+        k not in state or state[k] != v for k, v in updates.items()
+    )
+    if changed:
+        for k in drop:
+            state.pop(k, None)
+        state.update(updates)
+        save_player_state(player, state, full=full, day=today_str)
+
+def save_and_rerun(*drop, full=False, force=False, **updates):
+    """save_state(), then start a fresh run (for handlers inside `if st.button(...)`)."""
+    save_state(*drop, full=full, force=force, **updates)
+    st.rerun()
+
+# Per-run keys of focus mode (dropped when leaving it)
+FOCUS_KEYS = ("focus_order", "focus_cursor", "resume_cursor", "focus_answered")
+
+def iter_focus_ids():
+    """IDs to practice again (wrong OR skipped OR unsure) excluding those already mastered.
+
+    Unique, in order of first appearance (the order may repeat ids for spaced repetition).
+    Lazy, so "is there anything to practice?" stops at the first hit.
+    """
+    answered = state.get("answered") or {}
+    seen = set()
     for qid0 in state.get("order") or []:
-        a = state.get("answered", {}).get(str(qid0)) or {}
-        if a.get("mastered") is True:
+        if qid0 in seen:
             continue
-        if a.get("skipped") is True or a.get("correct") is False or a.get("unsure") is True:
-            out.append(int(qid0))
-    # Also include any items scheduled later in the order (spaced repetition) that match the criteria
-    # while keeping uniqueness and preserving order.
-    seen = set()
-    uniq = []
-    for i in out:
-        if i not in seen:
-            uniq.append(i)
-            seen.add(i)
-    return uniq
+        seen.add(qid0)
+        a = answered.get(str(qid0))
+        if needs_practice(a) and a.get("mastered") is not True:
+            yield int(qid0)
+
+def compute_focus_list():
+    return list(iter_focus_ids())
 
 # One bottom button to jump into focus practice from the current progress.
-focus_candidates = compute_focus_list()
-if state.get("mode") == "normal" and focus_candidates:
+if state.get("mode") == "normal" and next(iter_focus_ids(), None) is not None:
     if st.button("🎯 Ab jetzt nur Falsche / 'Ich weiß nicht' / Unsichere üben", use_container_width=True):
-        state["mode"] = "focus_wrong"
-        state["resume_cursor"] = int(state.get("cursor", 0))
-        state["focus_order"] = focus_candidates
-        state["focus_cursor"] = 0
         # IMPORTANT: In focus mode, questions must be answerable again.
         # We therefore track focus-run answers separately (do NOT reuse master answered-map).
-        state["focus_answered"] = {}
-        save_json(player_file(player), state)
-        st.rerun()
+        save_and_rerun(
+            mode="focus_wrong",
+            resume_cursor=int(state.get("cursor", 0)),
+            focus_order=compute_focus_list(),
+            focus_cursor=0,
+            focus_answered={},
+        )
 
 # If we are in focus mode, override the effective order/cursor for the UI.
 if state.get("mode") == "focus_wrong":
@@ -824,7 +1416,8 @@ if state.get("mode") == "focus_wrong":
 # - normal: state['answered'] (master progress)
 # - wrong-only practice (end-screen button): state['practice_answered']
 # - focus mode (bottom focus button): state['focus_answered']
-active_answered = state.get('answered', {})
+answered = state.setdefault("answered", {})  # master progress, hoisted for the rest of the run
+active_answered = answered
 if state.get('mode') == 'focus_wrong':
     active_answered = state.setdefault('focus_answered', {})
 elif state.get('practice_mode') == 'wrong_only':
@@ -838,25 +1431,15 @@ if state.get("mode") != "focus_wrong":
     only_unanswered = st.toggle("Nur unbeantwortete Fragen", value=False)
     if only_unanswered:
         start = min(cursor_pos, max(len(order) - 1, 0))
-        found = None
-        # 1) Vorwärts ab aktueller Position
-        for i in range(start, len(order)):
-            if str(order[i]) not in active_answered:
-                found = i
-                break
-        # 2) Wenn keine mehr vorne, dann wrap zum Anfang
-        if found is None:
-            for i in range(0, start):
-                if str(order[i]) not in active_answered:
-                    found = i
-                    break
+        # Vorwärts ab aktueller Position, dann wrap zum Anfang
+        found = find_unanswered(order, active_answered, start)
         if found is not None:
             cursor_pos = found
         else:
             st.success("Du hast alle Fragen einmal beantwortet 🎉")
 
 # Finished screen: show overview and next actions
-all_answered = all(str(qid0) in active_answered for qid0 in order)
+all_answered = find_unanswered(order, active_answered, cursor_pos) is None
 
 # Special finish screen for focus mode
 if state.get("mode") == "focus_wrong" and (cursor_pos >= len(order) or len(order) == 0):
@@ -864,14 +1447,8 @@ if state.get("mode") == "focus_wrong" and (cursor_pos >= len(order) or len(order
     col1, col2 = st.columns(2)
     with col1:
         if st.button("➡️ Normal weiter machen", use_container_width=True):
-            state["mode"] = "normal"
-            state["cursor"] = int(state.get("resume_cursor", state.get("cursor", 0)) or 0)
-            state.pop("focus_order", None)
-            state.pop("focus_cursor", None)
-            state.pop("resume_cursor", None)
-            state.pop("focus_answered", None)
-            save_json(player_file(player), state)
-            st.rerun()
+            resume = int(state.get("resume_cursor", state.get("cursor", 0)) or 0)
+            save_and_rerun(*FOCUS_KEYS, mode="normal", cursor=resume)
     with col2:
         # Rebuild focus list based on current answered status
         if st.button("🔁 Fokus nochmal starten", use_container_width=True):
@@ -879,144 +1456,62 @@ if state.get("mode") == "focus_wrong" and (cursor_pos >= len(order) or len(order
             if not focus_order:
                 st.info('Aktuell gibt es keine falschen/unsicheren/Ich weiß nicht Fragen mehr für den Fokus-Modus.')
                 # zurück in den Normalmodus
-                state["mode"] = "normal"
-                state["cursor"] = int(state.get("resume_cursor", state.get("cursor", 0)) or 0)
-                state.pop("focus_order", None)
-                state.pop("focus_cursor", None)
-                state.pop("resume_cursor", None)
-                state.pop("focus_answered", None)
-                save_json(player_file(player), state)
-                st.rerun()
-            state["mode"] = "focus_wrong"
-            state["focus_order"] = focus_order
-            state["focus_cursor"] = 0
+                resume = int(state.get("resume_cursor", state.get("cursor", 0)) or 0)
+                save_and_rerun(*FOCUS_KEYS, mode="normal", cursor=resume)
             # WICHTIG: Restart muss die Fokus-Antworten leeren, sonst bleibt alles "erledigt"
-            state["focus_answered"] = {}
-            save_json(player_file(player), state)
-            st.rerun()
+            save_and_rerun(mode="focus_wrong", focus_order=focus_order, focus_cursor=0, focus_answered={})
     st.stop()
 
 if cursor_pos >= len(order) or all_answered:
-    d = format_daily(state)
     if state.get('practice_mode') == 'wrong_only':
         st.success('🎯 Übungsrunde (nur falsche/übersprungene) abgeschlossen.')
         if st.button('↩️ Zurück zum normalen Quiz', use_container_width=True):
-            state['practice_mode'] = 'all'
-            state.pop('practice_answered', None)
-            ensure_daily_order(state, player, questions)
-            state['cursor'] = 0
-            save_json(player_file(player), state)
-            st.rerun()
+            # ensure_daily_order edits state in place; its flag makes sure that is saved too
+            order_changed = ensure_daily_order(state, player, question_ids, question_id_set, question_ids_fp, today_str)
+            save_and_rerun("practice_answered", practice_mode="all", cursor=0, force=order_changed)
         st.caption('Hinweis: Tagesstatistik/Leaderboard bleibt unverändert – das ist nur Üben.')
     else:
         st.success("🎉 Wow, du bist durch! Alle Fragen in diesem Durchlauf erledigt.")
     st.markdown(
-        f"**Heute:** ✅ {d['correct']}  ·  ❌ {d['wrong']}  ·  🟡 {d.get('unsure',0)}  ·  🤷 {d['skipped']}  ·  🧮 {d['total']}"
+        f"**Heute:** ✅ {daily_today['correct']}  ·  ❌ {daily_today['wrong']}  ·  🟡 {daily_today.get('unsure',0)}  ·  🤷 {daily_today['skipped']}  ·  🧮 {daily_today['total']}"
     )
 
     # Collect wrong/unknown questions for a targeted session
-    wrong_ids = []
-    for qid0 in order:
-        a = state.get("answered", {}).get(str(qid0)) or {}
-        # Treat skipped as "to practice"; open questions (correct=None) are not counted as wrong
-        if a.get("skipped") is True or a.get("correct") is False or a.get("unsure") is True:
-            wrong_ids.append(int(qid0))
+    wrong_ids = [int(qid0) for qid0 in order if needs_practice(answered.get(str(qid0)))]
 
     # --- Export (CSV / PDF) for wrong questions ---
-    by_id_finish = {int(qq["id"]): qq for qq in questions}
-    wrong_questions = [by_id_finish.get(int(i)) for i in wrong_ids]
+    wrong_questions = [by_id.get(i) for i in wrong_ids]
     wrong_questions = [w for w in wrong_questions if isinstance(w, dict)]
 
     if wrong_questions:
         st.markdown("#### 📤 Export deiner falschen/übersprungenen Fragen")
 
+        # Exports are cached per (wrong ids, dataset version, player, day): reruns of the
+        # finish screen only rebuild them when something actually changed.
+        export_key = (
+            tuple(wrong_ids),
+            get_questions_file().name,
+            file_mtime_ns(get_questions_file()),
+            file_mtime_ns(get_custom_file()),
+            player,
+            today_str,
+        )
+
         # CSV
-        csv_buf = io.StringIO()
-        writer = csv.writer(csv_buf)
-        writer.writerow(["id", "type", "question", "options", "correct", "explanation"])
-        for w in wrong_questions:
-            opts = w.get("options") or []
-            corr = w.get("correct") or []
-            writer.writerow([
-                w.get("id"),
-                w.get("type"),
-                w.get("question"),
-                " | ".join([str(x) for x in opts]),
-                ",".join([str(x) for x in corr]),
-                (w.get("explanation") or w.get("solution") or ""),
-            ])
-        csv_bytes = csv_buf.getvalue().encode("utf-8")
         st.download_button(
             "⬇️ Falsche Fragen als CSV",
-            data=csv_bytes,
-            file_name=f"falsche_fragen_{date.today().isoformat()}.csv",
+            data=build_wrong_csv(export_key, wrong_questions),
+            file_name=f"falsche_fragen_{today_str}.csv",
             mime="text/csv",
             use_container_width=True,
         )
 
         # PDF (optional; requires reportlab)
-        if canvas is not None and A4 is not None:
-            pdf_buffer = io.BytesIO()
-            c = canvas.Canvas(pdf_buffer, pagesize=A4)
-            width, height = A4
-            x = 40
-            y = height - 50
-            c.setFont("Helvetica-Bold", 14)
-            c.drawString(x, y, f"Falsche/übersprungene Fragen – {player}")
-            y -= 25
-            c.setFont("Helvetica", 10)
-            c.drawString(x, y, f"Datum: {date.today().isoformat()}   Anzahl: {len(wrong_questions)}")
-            y -= 30
-
-            def write_wrapped(text: str, y_pos: float, font="Helvetica", size=10, max_width=90):
-                c.setFont(font, size)
-                # Very simple wrapping by words
-                words = (text or "").split()
-                line = ""
-                for w0 in words:
-                    test = (line + " " + w0).strip()
-                    if len(test) > max_width:
-                        c.drawString(x, y_pos, line)
-                        y_pos -= 14
-                        line = w0
-                    else:
-                        line = test
-                if line:
-                    c.drawString(x, y_pos, line)
-                    y_pos -= 14
-                return y_pos
-
-            for idx, w in enumerate(wrong_questions, start=1):
-                if y < 120:
-                    c.showPage()
-                    y = height - 50
-                c.setFont("Helvetica-Bold", 11)
-                c.drawString(x, y, f"{idx}. (ID {w.get('id')})")
-                y -= 16
-                y = write_wrapped(str(w.get("question") or ""), y, font="Helvetica", size=10)
-
-                if w.get("type") == "mc":
-                    opts = w.get("options") or []
-                    corr = set(w.get("correct") or [])
-                    for oi, opt in enumerate(opts):
-                        prefix = "✅" if oi in corr else "•"
-                        y = write_wrapped(f"{prefix} {opt}", y, font="Helvetica", size=9)
-                else:
-                    sol = (w.get("solution") or "").strip()
-                    if sol:
-                        y = write_wrapped(f"Lösung: {sol}", y, font="Helvetica", size=9)
-
-                exp = (w.get("explanation") or "").strip()
-                if exp:
-                    y = write_wrapped(f"Erklärung: {exp}", y, font="Helvetica", size=9)
-                y -= 8
-
-            c.save()
-            pdf_bytes = pdf_buffer.getvalue()
+        if HAS_REPORTLAB:
             st.download_button(
                 "⬇️ Falsche Fragen als PDF",
-                data=pdf_bytes,
-                file_name=f"falsche_fragen_{date.today().isoformat()}.pdf",
+                data=build_wrong_pdf(export_key, wrong_questions),
+                file_name=f"falsche_fragen_{today_str}.pdf",
                 mime="application/pdf",
                 use_container_width=True,
             )
@@ -1026,14 +1521,16 @@ if cursor_pos >= len(order) or all_answered:
     colA, colB = st.columns(2)
     with colA:
         if st.button("🔁 Nur die Falschen üben", use_container_width=True, disabled=(len(wrong_ids) == 0)):
-            # New session order based on wrong questions
-            state["practice_mode"] = "wrong_only"
-            # Practice run should allow answering again -> separate answered map
-            state["practice_answered"] = {}
-            state["order"] = deterministic_shuffle(player, state.get("order_date", str(date.today())) + "|wrong", wrong_ids)
-            state["cursor"] = 0
-            save_json(player_file(player), state)
-            st.rerun()
+            # New session order based on wrong questions.
+            # Practice run should allow answering again -> separate answered map.
+            # Dropping ids_fp lets ensure_daily_order re-check the replaced order.
+            save_and_rerun(
+                "ids_fp",
+                practice_mode="wrong_only",
+                practice_answered={},
+                order=deterministic_shuffle(player, state.get("order_date", today_str) + "|wrong", wrong_ids),
+                cursor=0,
+            )
         if len(wrong_ids) == 0:
             st.caption("Keine falschen/übersprungenen Fragen — stark! 💪")
 
@@ -1041,10 +1538,10 @@ if cursor_pos >= len(order) or all_answered:
         if st.button("🎲 Alle von vorne (neu gemischt)", use_container_width=True):
             # Komplett neuer Durchlauf:
             # 1) Fortschritt dieses Durchlaufs zurücksetzen (sonst bleibt all_answered=True)
-            state["answered"] = {}
+            answered.clear()
 
             # 2) Heutige Zähler zurücksetzen (damit die Endübersicht nicht sofort wieder erscheint)
-            today_key = str(date.today())
+            today_key = today_str
             state.setdefault("daily", {})
             state["daily"][today_key] = {"correct": 0, "wrong": 0, "skipped": 0, "unsure": 0, "total": 0}
 
@@ -1058,80 +1555,30 @@ if cursor_pos >= len(order) or all_answered:
 
             # 4) Neue Mischung erzwingen (gleicher Tag -> anderer Shuffle)
             state["shuffle_nonce"] = int(state.get("shuffle_nonce", 0) or 0) + 1
-            ensure_daily_order(state, player, questions)
-            state["cursor"] = 0
-
-            save_json(player_file(player), state)
-            st.rerun()
+            ensure_daily_order(state, player, question_ids, question_id_set, question_ids_fp, today_str)
+            save_and_rerun(cursor=0, full=True)
 
     st.stop()
 
-# Build quick lookup
-by_id = {int(q["id"]): q for q in questions}
 qid = int(order[cursor_pos])
+qid_key = str(qid)  # key in the answered maps
 q = by_id[qid]
 
-st.progress((cursor_pos+1)/len(order))
-nav1, nav2, nav3, nav4 = st.columns([1, 4, 1, 1])
-with nav1:
-    if st.button("⬅ Zurück", disabled=(cursor_pos <= 0)):
-        state["cursor"] = max(0, cursor_pos - 1)
-        save_json(player_file(player), state)
-        st.rerun()
-with nav2:
-    st.write(f"**Frage {cursor_pos+1} von {len(order)}**  ·  ID: **{qid}**")
-with nav3:
-    # Weiter / Fertig: am Ende soll man zur Abschlussseite kommen.
-    is_last = (cursor_pos >= len(order) - 1)
-    can_advance_last = (str(qid) in active_answered)
-    btn_label = "Fertig ✅" if is_last else "Weiter ➡"
-    btn_disabled = (is_last and not can_advance_last)
-    if st.button(btn_label, disabled=btn_disabled):
-        state["cursor"] = len(order) if is_last else (cursor_pos + 1)
-        save_json(player_file(player), state)
-        st.rerun()
-with nav4:
-    # Jump straight to the end/overview (useful when you want to export or switch modes)
-    if st.button("⏭ Ende"):
-        state["cursor"] = len(order)
-        save_json(player_file(player), state)
-        st.rerun()
-
-st.markdown(f"### {q.get('question', '')}")
-
-answered_current = (active_answered or {}).get(str(qid))
-if answered_current:
-    st.caption("✅ Diese Frage wurde bereits beantwortet. Du kannst die Erklärung erneut anzeigen oder mit \"Weiter\" navigieren.")
-    cexp, _ = st.columns([1, 3])
-    with cexp:
-        if st.button("📌 Erklärung anzeigen", key=f"exp_{qid}"):
-            st.session_state["pending"] = {
-                "qid": qid,
-                "kind": "review",
-                "title": "Lösung + Erklärung",
-                "no_advance": True,
-                # reuse stored payload so selected answers stay consistent
-                "payload": answered_current,
-            }
-            st.rerun()
-
 # Session state per question (to allow explanation popup after submit)
 key_prefix = f"q{qid}"
-if f"{key_prefix}_done" not in st.session_state:
-    st.session_state[f"{key_prefix}_done"] = False
-if f"{key_prefix}_result" not in st.session_state:
-    st.session_state[f"{key_prefix}_result"] = None
+done_key, result_key = f"{key_prefix}_done", f"{key_prefix}_result"
+st.session_state.setdefault(done_key, False)
+st.session_state.setdefault(result_key, None)
 
 # Pending modal state
-if "pending" not in st.session_state:
-    st.session_state["pending"] = None
+st.session_state.setdefault("pending", None)
 
 def persist_and_advance(result_dict):
     # Count only the FIRST time a question is answered (prevents double counting when you navigate back).
     # First-time within the CURRENT run (normal or wrong-only practice)
-    first_time = str(qid) not in (active_answered or {})
+    first_time = qid_key not in active_answered
     # First-time overall (master progress) – used for daily/leaderboard counting
-    first_time_master = str(qid) not in state.get("answered", {})
+    first_time_master = qid_key not in answered
 
     in_focus = state.get("mode") == "focus_wrong"
 
@@ -1150,37 +1597,43 @@ def persist_and_advance(result_dict):
         if repeats >= 2:
             return
 
+        # A correct-but-unsure answer is better retained than a miss or a skip,
+        # so it comes back after twice the gap instead of crowding the next few questions.
         gap = int(state.get("sr_gap", 7) or 7)
+        if result_dict.get("unsure") and result_dict.get("correct") is True:
+            gap *= 2
         insert_at = min(cursor_pos + gap, len(order))
 
         # Don't schedule if it's already present ahead in the order
-        if qid in order[cursor_pos+1:]:
+        try:
+            order.index(qid, cursor_pos + 1)
             return
+        except ValueError:
+            pass
 
-        state["order"] = order[:insert_at] + [qid] + order[insert_at:]
+        order.insert(insert_at, qid)
+        state["order"] = order  # `order` may be the fallback list, not state's own
         # Mark that we scheduled a repeat for this question
         result_dict["repeats"] = repeats + 1
 
     if not in_focus:
         schedule_repeat_if_needed()
 
-    # Update answered record
-    prev = state.get("answered", {}).get(str(qid)) or {}
-    merged = {**prev, **result_dict}
+    # Update answered record (in place; the practice maps below share the same dict)
+    merged = answered.setdefault(qid_key, {})
+    merged.update(result_dict)
 
     # If we are re-practicing and now got it right (and not unsure), mark as mastered
     if in_focus and merged.get("correct") is True and not merged.get("skipped") and not merged.get("unsure"):
         merged["mastered"] = True
 
-    state["answered"][str(qid)] = merged
-
     # Track answered inside practice runs so questions are answerable again.
     # - focus mode uses focus_answered
     # - end-screen "Nur die Falschen üben" uses practice_answered
     if in_focus:
-        state.setdefault('focus_answered', {})[str(qid)] = merged
+        state.setdefault('focus_answered', {})[qid_key] = merged
     elif state.get('practice_mode') == 'wrong_only':
-        state.setdefault('practice_answered', {})[str(qid)] = merged
+        state.setdefault('practice_answered', {})[qid_key] = merged
 
     # Advance cursor depending on mode
     if in_focus:
@@ -1189,28 +1642,30 @@ def persist_and_advance(result_dict):
     else:
         # allow cursor == len(order) to represent "finished"
         state["cursor"] = min(cursor_pos+1, len(order))
-    save_json(player_file(player), state)
 
     in_practice = state.get('practice_mode') == 'wrong_only'
-
-    if first_time_master and (not in_practice) and (not in_focus):
+    counts = first_time_master and (not in_practice) and (not in_focus)
+    daily_delta = None
+    if counts:
         skipped = bool(result_dict.get("skipped"))
         correct_val = result_dict.get("correct")
-        bump_daily(state, correct=correct_val, skipped=skipped, unsure=bool(result_dict.get("unsure")))
-        save_json(player_file(player), state)
+        daily_delta = bump_daily(state, today_str, correct=correct_val, skipped=skipped, unsure=bool(result_dict.get("unsure")))
+
+    # One transaction for the answer record, cursor and today's counters
+    save_player_state(player, state, qids=[qid], day=today_str, daily_delta=daily_delta)
 
+    if counts:
         # Update shared leaderboard (Supabase if configured; else local sqlite)
-        day = str(date.today())
-        if skipped:
-            lb_upsert_daily(player, day, delta_skipped=1)
-        else:
-            if correct_val is True:
-                lb_upsert_daily(player, day, delta_correct=1)
-            elif correct_val is False:
-                lb_upsert_daily(player, day, delta_wrong=1)
+        deltas = {
+            "delta_correct": int(correct_val is True and not skipped),
+            "delta_wrong": int(correct_val is False and not skipped),
+            "delta_skipped": int(skipped),
+        }
+        if any(deltas.values()):
+            lb_upsert_daily(player, today_str, updated_at=result_dict.get("ts"), **deltas)
 
-    st.session_state[f"{key_prefix}_done"] = True
-    st.session_state[f"{key_prefix}_result"] = result_dict
+    st.session_state[done_key] = True
+    st.session_state[result_key] = result_dict
     st.session_state["pending"] = None
     st.rerun()
 
@@ -1290,191 +1745,269 @@ def show_feedback_modal(pending: dict):
                 persist_and_advance(pending["payload"])
 
 
-# If a modal is pending for THIS question, render it now and stop.
+st.progress((cursor_pos+1)/len(order))
+
+# If a modal is pending for THIS question, render it now and stop. Checked before
+# the nav bar so a modal rerun only sends the question title and the feedback;
+# navigation comes back once the modal is closed.
 pending = st.session_state.get("pending")
 if isinstance(pending, dict) and pending.get("qid") == qid:
+    st.markdown(f"### {q.get('question', '')}")
     show_feedback_modal(pending)
     st.stop()
 
-if q["type"] == "mc":
-    multi = (q.get("answerType","single") == "multi")
-    opts = q.get("options", [])
-    if not opts:
-        st.warning("Diese Frage hat keine Antwortoptionen (Datenproblem).")
-    else:
-        prev_selected = []
-        if answered_current and isinstance(answered_current.get("selected"), list):
-            prev_selected = answered_current.get("selected") or []
-        locked = bool(answered_current)
+nav1, nav2, nav3, nav4 = st.columns([1, 4, 1, 1])
+# Nav buttons update the cursor in on_click callbacks: one run per click instead of two.
+with nav1:
+    st.button("⬅ Zurück", disabled=(cursor_pos <= 0), on_click=save_state, kwargs={"cursor": max(0, cursor_pos - 1)})
+with nav2:
+    st.write(f"**Frage {cursor_pos+1} von {len(order)}**  ·  ID: **{qid}**")
+with nav3:
+    # Weiter / Fertig: am Ende soll man zur Abschlussseite kommen.
+    is_last = (cursor_pos >= len(order) - 1)
+    can_advance_last = (qid_key in active_answered)
+    btn_label = "Fertig ✅" if is_last else "Weiter ➡"
+    btn_disabled = (is_last and not can_advance_last)
+    st.button(btn_label, disabled=btn_disabled, on_click=save_state,
+              kwargs={"cursor": len(order) if is_last else (cursor_pos + 1)})
+with nav4:
+    # Jump straight to the end/overview (useful when you want to export or switch modes)
+    st.button("⏭ Ende", on_click=save_state, kwargs={"cursor": len(order)})
 
-        # When reviewing an already-answered question, visually mark:
-        # ✅ correct options, ❌ options the user selected that were wrong.
-        correct_set = set(int(i) for i in (q.get("correct") or []) if isinstance(i, int))
-        selected_set = set(int(i) for i in (prev_selected or []) if isinstance(i, int))
-
-        def option_label(i: int) -> str:
-            base = opts[i]
-            if not locked:
-                return base
-            # Review mode (locked)
-            if i in correct_set:
-                return f"✅ {base}"
-            if i in selected_set and i not in correct_set:
-                return f"❌ {base}"
-            # Unselected + incorrect: keep neutral (still readable, but no icon)
-            return f"   {base}"
-
-        if multi:
-            selected = st.multiselect(
-                "Wähle alle zutreffenden Antworten:",
-                list(range(len(opts))),
-                format_func=option_label,
-                default=[i for i in prev_selected if isinstance(i, int)],
-                disabled=locked,
-            )
+st.markdown(f"### {q.get('question', '')}")
+
+answered_current = active_answered.get(qid_key)
+if answered_current:
+    st.caption("✅ Diese Frage wurde bereits beantwortet. Du kannst die Erklärung erneut anzeigen oder mit \"Weiter\" navigieren.")
+    cexp, _ = st.columns([1, 3])
+    with cexp:
+        if st.button("📌 Erklärung anzeigen", key=f"exp_{qid}"):
+            st.session_state["pending"] = {
+                "qid": qid,
+                "kind": "review",
+                "title": "Lösung + Erklärung",
+                "no_advance": True,
+                # reuse stored payload so selected answers stay consistent
+                "payload": answered_current,
+            }
+            st.rerun()
+
+
+@st_fragment
+def render_answer_widgets(q: dict, qid: int, answered_current):
+    """Answer inputs + submit buttons for the current question.
+
+    The inputs sit in a form, so picking options or typing reruns nothing; the submit
+    buttons rerun only this fragment, which sets the pending modal and reruns the app.
+    """
+    if q["type"] == "mc":
+        multi = (q.get("answerType","single") == "multi")
+        opts = q.get("options", [])
+        if not opts:
+            st.warning("Diese Frage hat keine Antwortoptionen (Datenproblem).")
         else:
-            prev_index = prev_selected[0] if (prev_selected and isinstance(prev_selected[0], int)) else None
-            selected_one = st.radio(
-                "Wähle eine Antwort:",
-                list(range(len(opts))),
-                format_func=option_label,
-                index=prev_index,
-                disabled=locked,
-            )
-            selected = [] if selected_one is None else [selected_one]
-
-        # Optional: mark as "unsicher" (will be scheduled for repetition)
-        unsure_flag = st.checkbox("🟡 Ich bin mir unsicher (kommt später nochmal)", value=False, disabled=locked)
-
-        col1, col2, col3 = st.columns([1,1,1])
-        with col1:
-            if st.button("Antwort abgeben", disabled=(not selected) or locked):
-                correct = is_correct_mc(q, selected)
-                st.session_state["pending"] = {
-                    "qid": qid,
-                    "kind": "submit",
-                    "title": "Ergebnis",
-                    "correct": bool(correct),
-                    "payload": {
-                    "ts": datetime.now().isoformat(timespec="seconds"),
-                    "correct": bool(correct),
-                    "selected": selected,
-                    "unsure": bool(unsure_flag),
+            # Sanitized once here; the widgets and review labels below use it as is.
+            prev_selected = []
+            if answered_current and isinstance(answered_current.get("selected"), list):
+                prev_selected = [i for i in answered_current["selected"] if isinstance(i, int)]
+            locked = bool(answered_current)
+
+            # When reviewing an already-answered question, visually mark:
+            # ✅ correct options, ❌ options the user selected that were wrong.
+            # Labels are built once; the widgets only index into the list.
+            if locked:
+                correct_set = q.get("_correct_set") or frozenset(q.get("correct") or [])
+                selected_set = frozenset(prev_selected)
+                labels = [
+                    f"✅ {base}" if i in correct_set
+                    else f"❌ {base}" if i in selected_set
+                    # Unselected + incorrect: keep neutral (still readable, but no icon)
+                    else f"   {base}"
+                    for i, base in enumerate(opts)
+                ]
+            else:
+                labels = opts
+            option_label = labels.__getitem__
+
+            # A form, so picking options or ticking "unsicher" does not rerun anything;
+            # only the two submit buttons do.
+            with st.form(f"answer_{qid}", border=False):
+                if multi:
+                    selected = st.multiselect(
+                        "Wähle alle zutreffenden Antworten:",
+                        list(range(len(opts))),
+                        format_func=option_label,
+                        default=prev_selected,
+                        disabled=locked,
+                    )
+                else:
+                    prev_index = prev_selected[0] if prev_selected else None
+                    selected_one = st.radio(
+                        "Wähle eine Antwort:",
+                        list(range(len(opts))),
+                        format_func=option_label,
+                        index=prev_index,
+                        disabled=locked,
+                    )
+                    selected = [] if selected_one is None else [selected_one]
+
+                # Optional: mark as "unsicher" (will be scheduled for repetition)
+                unsure_flag = st.checkbox("🟡 Ich bin mir unsicher (kommt später nochmal)", value=False, disabled=locked)
+
+                col1, col2, col3 = st.columns([1,1,1])
+                with col1:
+                    submitted = st.form_submit_button("Antwort abgeben", disabled=locked)
+                    if submitted and not selected:
+                        st.warning("Bitte wähle zuerst eine Antwort.")
+                    elif submitted:
+                        correct = is_correct_mc(q, selected)
+                        st.session_state["pending"] = {
+                            "qid": qid,
+                            "kind": "submit",
+                            "title": "Ergebnis",
+                            "correct": bool(correct),
+                            "payload": {
+                            "ts": now_iso(),
+                            "correct": bool(correct),
+                            "selected": selected,
+                            "unsure": bool(unsure_flag),
+                            }
+                        }
+                        st.rerun()
+                with col2:
+                    if st.form_submit_button("Ich weiß nicht 🤷", disabled=locked):
+                        st.session_state["pending"] = {
+                            "qid": qid,
+                            "kind": "skip",
+                            "title": "Lösung + Erklärung",
+                            "payload": {
+                            "ts": now_iso(),
+                            "correct": False,
+                            "selected": None,
+                            "skipped": True,
+                            }
+                        }
+                        st.rerun()
+                with col3:
+                    st.write("")
+
+
+
+    elif q["type"] == "open":
+        st.caption("Offene Frage: tippe deine Antwort (Stichpunkte reichen). Danach bekommst du Lösung + Hinweise.")
+        prev_txt = ""
+        if answered_current and answered_current.get("freeText") is not None:
+            prev_txt = str(answered_current.get("freeText") or "")
+        locked = bool(answered_current)
+        with st.form(f"answer_{qid}", border=False):
+            user_answer = st.text_area("Deine Antwort", height=140, value=prev_txt, disabled=locked)
+
+            unsure_flag = st.checkbox("🟡 Ich bin mir unsicher (kommt später nochmal)", value=False, disabled=locked)
+
+            col1, col2 = st.columns([1,1])
+            with col1:
+                if st.form_submit_button("Antwort speichern & Lösung anzeigen", disabled=locked):
+                    st.session_state["pending"] = {
+                        "qid": qid,
+                        "kind": "open",
+                        "title": "Lösung + Erklärung",
+                        "payload": {
+                            "ts": now_iso(),
+                            "correct": None,
+                            "freeText": user_answer,
+                            "unsure": bool(unsure_flag),
+                        },
                     }
-                }
-                st.rerun()
-        with col2:
-            if st.button("Ich weiß nicht 🤷", disabled=locked):
-                st.session_state["pending"] = {
-                    "qid": qid,
-                    "kind": "skip",
-                    "title": "Lösung + Erklärung",
-                    "payload": {
-                    "ts": datetime.now().isoformat(timespec="seconds"),
-                    "correct": False,
-                    "selected": None,
-                    "skipped": True,
+                    st.rerun()
+            with col2:
+                if st.form_submit_button("Ich weiß nicht 🤷", disabled=locked):
+                    st.session_state["pending"] = {
+                        "qid": qid,
+                        "kind": "skip",
+                        "title": "Lösung + Erklärung",
+                        "payload": {
+                            "ts": now_iso(),
+                            "correct": None,
+                            "freeText": None,
+                            "skipped": True,
+                        },
                     }
-                }
-                st.rerun()
-        with col3:
-            st.write("")
+                    st.rerun()
 
+    else:
+        st.warning("Unbekannter Fragetyp im Datensatz.")
 
 
-elif q["type"] == "open":
-    st.caption("Offene Frage: tippe deine Antwort (Stichpunkte reichen). Danach bekommst du Lösung + Hinweise.")
-    prev_txt = ""
-    if answered_current and answered_current.get("freeText") is not None:
-        prev_txt = str(answered_current.get("freeText") or "")
-    locked = bool(answered_current)
-    user_answer = st.text_area("Deine Antwort", height=140, value=prev_txt, disabled=locked)
+render_answer_widgets(q, qid, answered_current)
 
-    unsure_flag = st.checkbox("🟡 Ich bin mir unsicher (kommt später nochmal)", value=False, disabled=locked)
+def save_custom_question(qobj: dict):
+    append_jsonl(get_custom_file(), qobj)
+    st.success("Gespeichert! Starte die App neu oder aktualisiere die Seite.")
 
-    col1, col2 = st.columns([1,1])
-    with col1:
-        if st.button("Antwort speichern & Lösung anzeigen", disabled=locked):
-            st.session_state["pending"] = {
-                "qid": qid,
-                "kind": "open",
-                "title": "Lösung + Erklärung",
-                "payload": {
-                    "ts": datetime.now().isoformat(timespec="seconds"),
-                    "correct": None,
-                    "freeText": user_answer,
-                    "unsure": bool(unsure_flag),
-                },
-            }
-            st.rerun()
-    with col2:
-        if st.button("Ich weiß nicht 🤷", disabled=locked):
-            st.session_state["pending"] = {
-                "qid": qid,
-                "kind": "skip",
-                "title": "Lösung + Erklärung",
-                "payload": {
-                    "ts": datetime.now().isoformat(timespec="seconds"),
-                    "correct": None,
-                    "freeText": None,
-                    "skipped": True,
-                },
-            }
-            st.rerun()
 
-else:
-    st.warning("Unbekannter Fragetyp im Datensatz.")
+@st_fragment
+def render_add_question():
+    """Form for user-added questions. Invalid input shows an error and returns (no st.stop()).
+
+    Runs as a fragment: switching the type or saving reruns only this form, not the quiz.
+    """
+    # Type selection stays outside the form so the matching fields appear right away.
+    # Everything else is a form: typing doesn't rerun the script, only "Speichern" does.
+    new_type = st.selectbox("Typ", list(CUSTOM_TYPE_LABELS), format_func=CUSTOM_TYPE_LABELS.get)
+    is_mc = new_type != "open"
+    answer_multi = new_type == "mc_multi"
+    with st.form("custom_q_form"):
+        new_question = st.text_area("Fragentext")
+        if is_mc:
+            raw_opts = st.text_area("Antwortoptionen (eine pro Zeile)")
+            correct_line = st.text_input("Richtige Option(en) – Indizes (0-basiert), z.B. 2 oder 0,3")
+            new_hint = st.text_area("Hinweis (optional)")
+            new_exp = st.text_area("Erklärung (optional)")
+        else:
+            sol = st.text_area("Lösungsvorschlag (optional)")
+            hint = st.text_area("Hinweise (optional)")
+        submitted = st.form_submit_button("Speichern")
+
+    if not submitted:
+        return
+    question_text = new_question.strip()
+
+    if is_mc:
+        # cheapest checks first; options are only split once the rest is valid
+        if not question_text:
+            st.error("Bitte Fragentext + mindestens 2 Optionen angeben.")
+            return
+        if not CORRECT_LINE_RE.match(correct_line):
+            st.error("Konnte richtige Indizes nicht lesen. Beispiel: 2 oder 0,3")
+            return
+        opts = list(filter(None, map(str.strip, raw_opts.splitlines())))
+        if len(opts) < 2:
+            st.error("Bitte Fragentext + mindestens 2 Optionen angeben.")
+            return
+        correct = sorted({int(x) for x in re.findall(r"\d+", correct_line)})
+        if not correct or correct[-1] >= len(opts):
+            st.error(f"Bitte mindestens einen gültigen Index zwischen 0 und {len(opts) - 1} angeben.")
+            return
+        save_custom_question(CUSTOM_MC_TEMPLATE | {
+            "question": question_text,
+            "options": opts,
+            "correct": correct,
+            "answerType": "multi" if answer_multi else "single",
+            "hint": new_hint.strip(),
+            "explanation": new_exp.strip(),
+        })
+    else:
+        if not question_text:
+            st.error("Bitte Fragentext angeben.")
+            return
+        save_custom_question(CUSTOM_OPEN_TEMPLATE | {
+            "question": question_text,
+            "solution": sol.strip(),
+            "hint": hint.strip(),
+        })
+
 
 st.divider()
 st.subheader("➕ Neue Frage hinzufügen")
 with st.expander("Neue Frage erstellen (wird dauerhaft gespeichert)"):
-    new_type = st.selectbox("Typ", ["mc (Single Choice)", "mc (Multiple Choice)", "open"])
-    new_question = st.text_area("Fragentext")
-    if new_type.startswith("mc"):
-        raw_opts = st.text_area("Antwortoptionen (eine pro Zeile)")
-        correct_line = st.text_input("Richtige Option(en) – Indizes (0-basiert), z.B. 2 oder 0,3")
-        new_hint = st.text_area("Hinweis (optional)")
-        new_exp = st.text_area("Erklärung (optional)")
-        if st.button("Speichern"):
-            opts = [l.strip() for l in raw_opts.splitlines() if l.strip()]
-            if not new_question.strip() or len(opts) < 2:
-                st.error("Bitte Fragentext + mindestens 2 Optionen angeben.")
-            else:
-                try:
-                    correct = [int(x.strip()) for x in correct_line.split(",") if x.strip() != ""]
-                except Exception:
-                    st.error("Konnte richtige Indizes nicht lesen. Beispiel: 2 oder 0,3")
-                    st.stop()
-                qobj = {
-                    "type": "mc",
-                    "question": new_question.strip(),
-                    "options": opts,
-                    "correct": correct,
-                    "answerType": "multi" if "Multiple" in new_type else "single",
-                    "hint": new_hint.strip(),
-                    "explanation": new_exp.strip(),
-                    "confidence": "user_added"
-                }
-                custom = load_json(get_custom_file(), [])
-                custom.append(qobj)
-                save_json(get_custom_file(), custom)
-                st.success("Gespeichert! Starte die App neu oder aktualisiere die Seite.")
-    else:
-        sol = st.text_area("Lösungsvorschlag (optional)")
-        hint = st.text_area("Hinweise (optional)")
-        if st.button("Speichern"):
-            if not new_question.strip():
-                st.error("Bitte Fragentext angeben.")
-            else:
-                qobj = {
-                    "type": "open",
-                    "question": new_question.strip(),
-                    "options": [],
-                    "solution": sol.strip(),
-                    "hint": hint.strip(),
-                    "source": "user_added"
-                }
-                custom = load_json(get_custom_file(), [])
-                custom.append(qobj)
-                save_json(get_custom_file(), custom)
-                st.success("Gespeichert! Starte die App neu oder aktualisiere die Seite.")
+    render_add_question()